@@ -5,7 +5,6 @@ Command-line interface for image encryption/decryption.
 import argparse
 import sys
 from pathlib import Path
-from image_encryption import ImageEncryptor
 
 
 def main():
@@ -17,18 +16,25 @@ def main():
     
     # Encrypt command
     encrypt_parser = subparsers.add_parser('encrypt', help='Encrypt an image')
-    encrypt_parser.add_argument('input', help='Input image path')
-    encrypt_parser.add_argument('output', help='Output encrypted image path')
+    encrypt_parser.add_argument('input', help="Input image path ('-' for stdin)")
+    encrypt_parser.add_argument('output', help="Output encrypted image path ('-' for stdout)")
     encrypt_parser.add_argument(
         '--mode',
         choices=['CBC', 'CFB', 'OFB', 'CTR'],
-        default='CBC',
-        help='Cipher mode (default: CBC)'
+        default='CTR',
+        help='Cipher mode (default: CTR)'
     )
     encrypt_parser.add_argument(
         '--key',
         help='Encryption key file path (if not provided, generates a new key)'
     )
+    encrypt_parser.add_argument(
+        '--key-size',
+        type=int,
+        choices=[16, 24, 32],
+        default=16,
+        help='Size in bytes of a generated key (default: 16, AES-128; 32 for AES-256)'
+    )
     encrypt_parser.add_argument(
         '--save-key',
         help='Path to save the encryption key'
@@ -36,13 +42,13 @@ def main():
     
     # Decrypt command
     decrypt_parser = subparsers.add_parser('decrypt', help='Decrypt an image')
-    decrypt_parser.add_argument('input', help='Input encrypted image path')
-    decrypt_parser.add_argument('output', help='Output decrypted image path')
+    decrypt_parser.add_argument('input', help="Input encrypted image path ('-' for stdin)")
+    decrypt_parser.add_argument('output', help="Output decrypted image path ('-' for stdout)")
     decrypt_parser.add_argument(
         '--mode',
         choices=['CBC', 'CFB', 'OFB', 'CTR'],
-        default='CBC',
-        help='Cipher mode (must match encryption mode)'
+        default='CTR',
+        help='Cipher mode (must match encryption mode, default: CTR)'
     )
     decrypt_parser.add_argument(
         '--key',
@@ -56,6 +62,15 @@ def main():
         parser.print_help()
         sys.exit(1)
     
+    # Imported here so --help and usage errors skip loading cryptography
+    from image_encryption import ImageEncryptor
+    
+    # '-' streams through stdin/stdout; status messages then go to stderr
+    # so they do not mix with the image data
+    source = sys.stdin.buffer if args.input == '-' else args.input
+    sink = sys.stdout.buffer if args.output == '-' else args.output
+    log = sys.stderr if args.output == '-' else sys.stdout
+    
     try:
         if args.command == 'encrypt':
             # Load or generate key
@@ -65,24 +80,24 @@ def main():
                 key = None
             
             # Create encryptor
-            encryptor = ImageEncryptor(key=key, mode=args.mode)
+            encryptor = ImageEncryptor(key=key, mode=args.mode, key_size=args.key_size)
             
             # Encrypt image
-            iv = encryptor.encrypt_image(args.input, args.output)
+            iv = encryptor.encrypt_image(source, sink)
             
-            print(f"[OK] Image encrypted successfully!")
-            print(f"  Input: {args.input}")
-            print(f"  Output: {args.output}")
-            print(f"  Mode: {args.mode}")
-            print(f"  IV: {iv.hex()}")
+            print(f"[OK] Image encrypted successfully!", file=log)
+            print(f"  Input: {args.input}", file=log)
+            print(f"  Output: {args.output}", file=log)
+            print(f"  Mode: {args.mode}", file=log)
+            print(f"  IV: {iv.hex()}", file=log)
             
             # Save key if requested
             if args.save_key:
                 encryptor.save_key(args.save_key)
-                print(f"  Key saved to: {args.save_key}")
+                print(f"  Key saved to: {args.save_key}", file=log)
             else:
-                print(f"  Key (hex): {encryptor.get_key_hex()}")
-                print("  [WARNING] Save this key securely! You'll need it for decryption.")
+                print(f"  Key (hex): {encryptor.get_key_hex()}", file=log)
+                print("  [WARNING] Save this key securely! You'll need it for decryption.", file=log)
         
         elif args.command == 'decrypt':
             # Load key
@@ -92,12 +107,12 @@ def main():
             encryptor = ImageEncryptor(key=key, mode=args.mode)
             
             # Decrypt image
-            encryptor.decrypt_image(args.input, args.output)
+            encryptor.decrypt_image(source, sink)
             
-            print(f"[OK] Image decrypted successfully!")
-            print(f"  Input: {args.input}")
-            print(f"  Output: {args.output}")
-            print(f"  Mode: {args.mode}")
+            print(f"[OK] Image decrypted successfully!", file=log)
+            print(f"  Input: {args.input}", file=log)
+            print(f"  Output: {args.output}", file=log)
+            print(f"  Mode: {args.mode}", file=log)
     
     except FileNotFoundError as e:
         print(f"[ERROR] File not found - {e}", file=sys.stderr)